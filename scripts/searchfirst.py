@@ -4,19 +4,81 @@
 
 """SearchFirst script to run a simple segmentation."""
 
+from typing import Annotated, List, Optional
+
 import typer
 
-from faim_wako_searchfirst.main import run
+from faim_wako_searchfirst.daemon import parse_address, read_authkey, submit
 
 
-def main(folder_path: str):
-    """Segment images in the given acquisition folder.
+def main(
+    folder_paths: List[str],
+    config: Annotated[Optional[List[str]], typer.Option(help="Config file, or one per folder.")] = None,
+    checkpoint: Annotated[Optional[str], typer.Option(help="File recording completed fields.")] = None,
+    workers: Annotated[Optional[int], typer.Option(help="Number of worker threads.")] = None,
+    memory_limit: Annotated[Optional[float], typer.Option(help="Memory budget (in MB) for images in flight.")] = None,
+    daemon: Annotated[Optional[str], typer.Option(help="Submit to a running service at [host:]port.")] = None,
+    authkey_file: Annotated[Optional[str], typer.Option(help="File with the shared secret of the service.")] = None,
+    estimate: Annotated[bool, typer.Option(help="Only estimate runtime and memory from a few fields.")] = False,
+    samples: Annotated[int, typer.Option(help="Number of fields to process for --estimate.")] = 3,
+    resample: Annotated[bool, typer.Option(help="Only re-run the sample method on saved label images.")] = False,
+):
+    """Segment images in the given acquisition folder(s).
 
     All additional parameters are defined in the provided config file.
+    With several folders, all their fields are processed on one shared worker pool.
 
-    :param folder_path: Folder containing the first pass acquisition.
+    :param folder_paths: Folder(s) containing the first pass acquisition.
+    :param config: Config file (default: config.yml), or one config file per folder.
+    :param checkpoint: File recording completed fields; rerun with the same file to resume an interrupted batch.
+    :param workers: Number of worker threads shared by all folders.
+    :param memory_limit: Approximate memory budget (in MB) for all images processed at the same time.
+    :param daemon: Address ([host:]port) of a service started with `searchfirst_daemon.py`, to process there.
+    :param authkey_file: File with the shared secret of the service
+        (default: FAIM_WAKO_SEARCHFIRST_AUTHKEY environment variable).
+    :param estimate: Process only a random sample of fields (without writing results), and print
+        estimated runtime, peak memory and a recommended number of workers for each folder.
+    :param samples: Number of fields to process per folder for --estimate.
+    :param resample: Re-run only the sample method (and plan) from label images saved by an earlier run.
     """
-    run(folder=folder_path, configfile="config.yml")
+    config = config or ["config.yml"]
+    if daemon is not None:
+        authkey = read_authkey(authkey_file)
+        for folder_path, configfile in zip(
+            folder_paths, config * len(folder_paths) if len(config) == 1 else config, strict=True
+        ):
+            result = submit(folder_path, configfile, address=parse_address(daemon), authkey=authkey)
+            typer.echo(f"{folder_path}: {result}")
+            if result["status"] != "done":
+                raise typer.Exit(code=1)
+        return
+
+    # Imported here, so that submitting to a running service starts fast
+    from faim_wako_searchfirst.main import estimate as estimate_plate
+    from faim_wako_searchfirst.main import format_estimate, run, run_batch
+    from faim_wako_searchfirst.main import resample as resample_plate
+
+    if estimate or resample:
+        configfiles = config * len(folder_paths) if len(config) == 1 else config
+        for folder_path, configfile in zip(folder_paths, configfiles, strict=True):
+            if resample:
+                csv_paths = resample_plate(folder_path, configfile)
+                typer.echo(f"{folder_path}: {len(csv_paths)} csv files written")
+            else:
+                result = estimate_plate(folder_path, configfile, n_samples=samples, max_workers=workers)
+                typer.echo(f"{folder_path}\n{format_estimate(result)}")
+        return
+
+    if len(folder_paths) == 1 and len(config) == 1 and checkpoint is None and workers is None and memory_limit is None:
+        run(folder=folder_paths[0], configfile=config[0])
+    else:
+        run_batch(
+            folders=folder_paths,
+            configfiles=config if len(config) > 1 else config[0],
+            checkpoint=checkpoint,
+            max_workers=workers,
+            memory_limit=memory_limit,
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,32 @@
+# SPDX-FileCopyrightText: 2025 Friedrich Miescher Institute for Biomedical Research (FMI), Basel (Switzerland)
+#
+# SPDX-License-Identifier: MIT
+
+"""SearchFirst script to start a long-running analysis service."""
+
+from typing import Annotated, Optional
+
+import typer
+
+from faim_wako_searchfirst.daemon import DEFAULT_ADDRESS, read_authkey, serve
+
+
+def main(
+    port: Annotated[int, typer.Option(help="Local port to listen on.")] = DEFAULT_ADDRESS[1],
+    authkey_file: Annotated[Optional[str], typer.Option(help="File with the shared secret for clients.")] = None,
+    workers: Annotated[Optional[int], typer.Option(help="Number of worker threads.")] = None,
+):
+    """Process acquisition folders submitted with `searchfirst.py --daemon PORT`.
+
+    Imports, config files and cellpose models stay loaded between jobs.
+
+    :param port: Local port to listen on.
+    :param authkey_file: File with the shared secret (default: FAIM_WAKO_SEARCHFIRST_AUTHKEY environment variable),
+        clients must use the same key.
+    :param workers: Number of worker threads shared by all jobs.
+    """
+    serve(address=(DEFAULT_ADDRESS[0], port), authkey=read_authkey(authkey_file), max_workers=workers)
+
+
+if __name__ == "__main__":
+    typer.run(main)
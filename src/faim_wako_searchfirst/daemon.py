@@ -0,0 +1,179 @@
+# SPDX-FileCopyrightText: 2025 Friedrich Miescher Institute for Biomedical Research (FMI), Basel (Switzerland)
+#
+# SPDX-License-Identifier: MIT
+
+"""Long-running analysis service for Wako SearchFirst first pass acquisitions.
+
+The service listens on a local socket and processes "folder + config file" jobs
+on one shared worker pool. Imports, parsed config files and cellpose models (loaded once per worker thread)
+stay warm between jobs, so the latency from acquisition end to csv files is just the compute time.
+Jobs are processed one after the other, each with the `execution` limits of its config,
+so that the memory budget of a config also holds for the service.
+
+Each job is answered with a result dict when done:
+  * `status`: "done", or "failed" if no csv file was written
+  * `csv_files`: paths of the csv files written
+  * `failed_files`: paths of the images that failed to process (see the log file of the folder)
+  * `error`: error message (if failed)
+  * `elapsed`: processing time in seconds
+
+Messages are pickled, so the service and its clients must share a secret key, read from
+the `FAIM_WAKO_SEARCHFIRST_AUTHKEY` environment variable or from a file readable only by trusted users.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+DEFAULT_ADDRESS = ("localhost", 6000)
+AUTHKEY_VARIABLE = "FAIM_WAKO_SEARCHFIRST_AUTHKEY"
+
+logger = logging.getLogger(__name__)
+
+
+def read_authkey(authkey_file: Optional[Union[str, Path]] = None) -> bytes:
+    """Return the shared secret key, from 'authkey_file' or the `FAIM_WAKO_SEARCHFIRST_AUTHKEY` environment variable."""
+    if authkey_file is not None:
+        authkey = Path(authkey_file).read_bytes().strip()
+    else:
+        authkey = os.environ.get(AUTHKEY_VARIABLE, "").encode()
+    if not authkey:
+        raise ValueError(f"No authentication key: set {AUTHKEY_VARIABLE} or provide a non-empty key file.")
+    return authkey
+
+
+def serve(
+    address: Tuple[str, int] = DEFAULT_ADDRESS,
+    authkey: Optional[bytes] = None,
+    max_workers: Optional[int] = None,
+):
+    """Process jobs sent by `submit` until a shutdown request is received.
+
+    Invalid connections and requests are logged and rejected, without stopping the service.
+
+    :param address: (host, port) to listen on, should be a local address
+    :param authkey: shared secret, clients must use the same key (default: `read_authkey()`)
+    :param max_workers: number of worker threads shared by all jobs
+    """
+    # Imported here, so that clients only importing `submit` start fast
+    from faim_wako_searchfirst.main import run
+
+    authkey = authkey or read_authkey()
+    # one job at a time: each job schedules its fields within its own memory budget
+    job_lock = threading.Lock()
+    queued = {}
+    running = {}
+    jobs = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor, Listener(address, authkey=authkey) as listener:
+        while True:
+            try:
+                connection = listener.accept()
+            except Exception as e:
+                logger.warning(f"Rejected connection: {e!r}")
+                continue
+            try:
+                request = connection.recv()
+                command = request.get("command", "process")
+                if command in ("status", "shutdown"):
+                    with connection:
+                        connection.send(
+                            {"status": command, "running": list(running.values()), "queued": list(queued.values())}
+                        )
+                    if command == "shutdown":
+                        break
+                    continue
+                if command != "process" or "folder" not in request or "configfile" not in request:
+                    raise ValueError(f"Invalid request: {request!r}")
+            except Exception as e:
+                logger.warning(f"Rejected request: {e!r}")
+                _reject(connection, e)
+                continue
+            key = object()
+            queued[key] = request["folder"]
+            job = threading.Thread(
+                target=_process_job,
+                args=(run, executor, connection, request, key),
+                kwargs={"job_lock": job_lock, "queued": queued, "running": running},
+            )
+            job.start()
+            jobs = [j for j in jobs if j.is_alive()] + [job]
+        for job in jobs:
+            job.join()
+
+
+def _reject(connection, error: Exception):
+    """Answer an invalid request with an error, if the client still listens, and close the connection."""
+    try:
+        with connection:
+            connection.send({"status": "failed", "error": repr(error)})
+    except Exception:
+        pass
+
+
+def _process_job(run, executor, connection, request, key, job_lock, queued, running):
+    """Process the folder of a single job request, once no other job is running, and send the result."""
+    with job_lock:
+        running[key] = queued.pop(key)
+        start = time.perf_counter()
+        failed_files = []
+        try:
+            csv_files = run(
+                request["folder"],
+                request["configfile"],
+                executor=executor,
+                on_error=lambda tif_file, error: failed_files.append(str(tif_file)),
+            )
+            result = {
+                "status": "done" if csv_files else "failed",
+                "csv_files": [str(path) for path in csv_files],
+                "failed_files": sorted(failed_files),
+            }
+            if not csv_files:
+                result["error"] = "No csv files written."
+        except Exception as e:
+            result = {"status": "failed", "error": repr(e)}
+        finally:
+            del running[key]
+        result["elapsed"] = time.perf_counter() - start
+    try:
+        with connection:
+            connection.send(result)
+    except Exception as e:
+        logger.warning(f"Could not send result for {request['folder']}: {e!r}")
+
+
+def submit(
+    folder: Union[str, Path],
+    configfile: Union[str, Path],
+    address: Tuple[str, int] = DEFAULT_ADDRESS,
+    authkey: Optional[bytes] = None,
+) -> dict:
+    """Send a job to a running service and wait for its result."""
+    with Client(address, authkey=authkey or read_authkey()) as connection:
+        connection.send({"folder": str(Path(folder).resolve()), "configfile": str(Path(configfile).resolve())})
+        return connection.recv()
+
+
+def status(address: Tuple[str, int] = DEFAULT_ADDRESS, authkey: Optional[bytes] = None) -> dict:
+    """Return the folders currently processed ('running') and waiting ('queued') on a running service."""
+    with Client(address, authkey=authkey or read_authkey()) as connection:
+        connection.send({"command": "status"})
+        return connection.recv()
+
+
+def shutdown(address: Tuple[str, int] = DEFAULT_ADDRESS, authkey: Optional[bytes] = None) -> dict:
+    """Stop a running service, once its current jobs are done."""
+    with Client(address, authkey=authkey or read_authkey()) as connection:
+        connection.send({"command": "shutdown"})
+        return connection.recv()
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    """Parse a 'host:port' (or just 'port') string into an address tuple."""
+    host, _, port = address.rpartition(":")
+    return (host or DEFAULT_ADDRESS[0], int(port))
@@ -6,26 +6,54 @@
 
 Each method must accept a file path and a label image as first two arguments,
 and must modify the label image inplace.
+Methods also accept an optional `objects` keyword argument, an `ObjectTable` of the label image,
+which they use instead of measuring the label image again, and which they keep up to date.
 The file path can be used to find related files for more complex object filtering,
 e.g. by intensity in a different channel.
 """
 
 import re
 from pathlib import Path
+from typing import List, Optional, Union
 
+import numpy as np
 from numpy import ndarray
-from skimage.measure import regionprops
-from skimage.segmentation import clear_border, expand_labels
+from scipy import ndimage
+from skimage.segmentation import expand_labels
 from tifffile import imread
 
+from faim_wako_searchfirst.objects import ObjectTable
 
-def bounding_box(tif_file: Path, labels, min_x: int, min_y: int, max_x: int, max_y: int):
+
+def bounding_box(
+    tif_file: Path,
+    labels,
+    min_x: int,
+    min_y: int,
+    max_x: int,
+    max_y: int,
+    objects: Optional[ObjectTable] = None,
+):
     """Modify 'labels' to set everything outside the bounding box to zero."""
-    labels[0 : max(min_y, 0), :] = 0
-    labels[:, 0 : max(min_x, 0)] = 0
-    y, x = labels.shape
-    labels[min(max_y, y) : y, :] = 0
-    labels[:, min(max_x, x) : x] = 0
+    if objects is None:
+        _clear_outside(labels, (0, 0), min_x, min_y, max_x, max_y)
+        return
+    # only objects crossing the bounding box border have to be cropped
+    min_row, min_col, max_row, max_col = objects.bbox.T
+    inside = (min_row >= min_y) & (min_col >= min_x) & (max_row <= max_y) & (max_col <= max_x)
+    for i in np.flatnonzero(~inside):
+        crop = objects.slice(i)
+        _clear_outside(labels[crop], (crop[0].start, crop[1].start), min_x, min_y, max_x, max_y)
+    objects.update(objects.label[~inside])
+
+
+def _clear_outside(view: ndarray, offset, min_x: int, min_y: int, max_x: int, max_y: int):
+    """Set everything in 'view' (located at 'offset' in the label image) outside the bounding box to zero."""
+    height, width = view.shape
+    view[0 : max(min(min_y - offset[0], height), 0), :] = 0
+    view[:, 0 : max(min(min_x - offset[1], width), 0)] = 0
+    view[max(max_y - offset[0], 0) : height, :] = 0
+    view[:, max(max_x - offset[1], 0) : width] = 0
 
 
 def area(
@@ -33,12 +61,11 @@ def area(
     labels: ndarray,
     min_area: int,
     max_area: int,
+    objects: Optional[ObjectTable] = None,
 ):
     """Modify 'labels' to only keep objects within range."""
-    regions = regionprops(labels)
-    for region in regions:
-        if not min_area <= region.area <= max_area:
-            labels[labels == region.label] = 0
+    objects = objects if objects is not None else ObjectTable(labels)
+    objects.keep((min_area <= objects.area) & (objects.area <= max_area))
 
 
 def feature(
@@ -47,15 +74,12 @@ def feature(
     feature: str,
     min_value: float,
     max_value: float,
+    objects: Optional[ObjectTable] = None,
 ):
     """Filter objects in 'labels' by specified feature value range."""
-    regions = regionprops(labels)
-    if hasattr(regions[0], feature):
-        for region in regions:
-            if not min_value <= getattr(region, feature) <= max_value:
-                labels[labels == region.label] = 0
-    else:
-        raise AttributeError(f"'regionprops' object has no attribute '{feature}'")
+    objects = objects if objects is not None else ObjectTable(labels)
+    values = objects.property(feature)
+    objects.keep((min_value <= values) & (values <= max_value))
 
 
 def solidity(
@@ -63,41 +87,93 @@ def solidity(
     labels: ndarray,
     min_solidity: int,
     max_solidity: int,
+    objects: Optional[ObjectTable] = None,
 ):
     """Modify 'labels' to only keep objects within range."""
-    regions = regionprops(labels)
-    for region in regions:
-        if not min_solidity <= region.solidity <= max_solidity:
-            labels[labels == region.label] = 0
+    objects = objects if objects is not None else ObjectTable(labels)
+    values = objects.property("solidity")
+    objects.keep((min_solidity <= values) & (values <= max_solidity))
 
 
 def border(
     tif_file: Path,
     labels: ndarray,
     margin: int = 0,
+    objects: Optional[ObjectTable] = None,
 ):
-    """Modify 'labels' to discard objects touching the image border."""
-    labels[:] = clear_border(labels=labels, buffer_size=margin)
+    """Modify 'labels' to discard objects touching the image border (within 'margin' pixels)."""
+    objects = objects if objects is not None else ObjectTable(labels)
+    height, width = labels.shape
+    min_row, min_col, max_row, max_col = objects.bbox.T
+    touching = (min_row <= margin) | (min_col <= margin) | (max_row >= height - margin) | (max_col >= width - margin)
+    objects.remove(objects.label[touching])
 
 
 def dilate(
     tif_file: Path,
     labels: ndarray,
     pixel_distance: float = 10.0,
+    objects: Optional[ObjectTable] = None,
 ):
-    """Dilate objects by specified amount."""
-    labels[:] = expand_labels(label_image=labels, distance=pixel_distance)
+    """Dilate objects by specified amount.
+
+    Each object is dilated within a crop around its bounding box, which includes all objects
+    competing for the same pixels. If the crops cover more than the image, the full image is dilated at once.
+    """
+    objects = objects if objects is not None else ObjectTable(labels)
+    distance = int(np.ceil(pixel_distance))
+    outer_crops = [objects.slice(i, padding=2 * distance) for i in range(len(objects))]
+    if sum((rows.stop - rows.start) * (cols.stop - cols.start) for rows, cols in outer_crops) >= labels.size:
+        labels[:] = expand_labels(label_image=labels, distance=pixel_distance)
+    else:
+        grown = []
+        for i, outer in enumerate(outer_crops):
+            inner = objects.slice(i, padding=distance)
+            # position of the inner crop within the outer crop
+            within = tuple(slice(a.start - b.start, a.stop - b.start) for a, b in zip(inner, outer, strict=True))
+            crop = labels[outer]
+            expanded = expand_labels(label_image=crop, distance=pixel_distance)[within]
+            grown.append((inner, (expanded == objects.label[i]) & (crop[within] == 0), objects.label[i]))
+        for inner, mask, label_value in grown:
+            labels[inner][mask] = label_value
+    objects.update(padding=distance)
 
 
 def intensity(
     tif_file: Path,
     labels: ndarray,
-    target_channel: str,
-    min_intensity: int,
+    target_channel: Union[str, List[str]],
+    min_intensity: Union[float, List[float]],
+    max_intensity: Union[float, List[float]] = np.inf,
+    statistic: str = "mean",
+    background_correction: bool = False,
+    objects: Optional[ObjectTable] = None,
 ):
-    """Filter objects in 'labels' by intensity in other channel."""
-    intensity_image = imread(_get_other_channel_file(tif_file, target_channel))
-    _filter_objects_by_intensity(labels, intensity_image, min_intensity)
+    """Filter objects in 'labels' by intensity in one or more other channels.
+
+    Objects are kept if their intensity 'statistic' is within range in all target channels.
+
+    :param target_channel: channel ID, or list of channel IDs
+    :param min_intensity: lower limit, or list of lower limits (one per channel)
+    :param max_intensity: upper limit, or list of upper limits (one per channel)
+    :param statistic: one of 'mean', 'median', 'min', 'max', 'integrated'
+    :param background_correction: if true, subtract the median intensity of unlabeled pixels
+    """
+    objects = objects if objects is not None else ObjectTable(labels)
+    if len(objects) == 0:
+        # nothing to filter, skip reading the other channels
+        return
+    channels = [target_channel] if isinstance(target_channel, str) else list(target_channel)
+    intensity_images = [imread(_get_other_channel_file(tif_file, channel)) for channel in channels]
+    _filter_objects_by_intensity(
+        labels,
+        intensity_images,
+        min_intensity,
+        max_intensity=max_intensity,
+        statistic=statistic,
+        background_correction=background_correction,
+        objects=objects,
+    )
 
 
 def _get_other_channel_file(tif_file: Path, target_channel: str) -> Path:
@@ -113,12 +189,48 @@ def _get_other_channel_file(tif_file: Path, target_channel: str) -> Path:
     raise FileNotFoundError(f"No matching file for channel {target_channel}.")
 
 
-def _filter_objects_by_intensity(labels, img, min_intensity):
-    """Filter objects in 'labels' by intensity in 'img'.
+def _filter_objects_by_intensity(
+    labels,
+    img,
+    min_intensity,
+    max_intensity=np.inf,
+    statistic: str = "mean",
+    background_correction: bool = False,
+    objects: Optional[ObjectTable] = None,
+):
+    """Filter objects in 'labels' by intensity in 'img' (a single image or a list of images).
 
     Apply changes inplace in 'labels'.
     """
-    regions = regionprops(labels, img)
-    for region in regions:
-        if region.intensity_mean < min_intensity:
-            labels[labels == region.label] = 0
+    objects = objects if objects is not None else ObjectTable(labels)
+    images = img if isinstance(img, (list, tuple)) else [img]
+    min_values = np.broadcast_to(min_intensity, len(images))
+    max_values = np.broadcast_to(max_intensity, len(images))
+    keep = np.ones(len(objects), dtype=bool)
+    for image, min_value, max_value in zip(images, min_values, max_values, strict=True):
+        values = _intensity_statistic(labels, image, objects, statistic)
+        if background_correction:
+            unlabeled = image[labels == 0]
+            background = np.median(unlabeled) if unlabeled.size > 0 else 0.0
+            values = values - background * (objects.area if statistic == "integrated" else 1)
+        keep &= (min_value <= values) & (values <= max_value)
+    objects.keep(keep)
+
+
+_NDIMAGE_STATISTICS = {
+    "median": ndimage.median,
+    "min": ndimage.minimum,
+    "max": ndimage.maximum,
+}
+
+
+def _intensity_statistic(labels: ndarray, img: ndarray, objects: ObjectTable, statistic: str) -> ndarray:
+    """Compute an intensity statistic for all objects at once."""
+    if len(objects) == 0:
+        return np.zeros(0)
+    if statistic in ("mean", "integrated"):
+        sums = np.bincount(labels.ravel(), weights=img.ravel(), minlength=int(objects.label.max()) + 1)
+        return sums[objects.label] / (objects.area if statistic == "mean" else 1)
+    if statistic in _NDIMAGE_STATISTICS:
+        return np.asarray(_NDIMAGE_STATISTICS[statistic](img, labels=labels, index=objects.label), dtype=float)
+    raise ValueError(f"Unknown intensity statistic: '{statistic}'")
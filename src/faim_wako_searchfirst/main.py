@@ -11,69 +11,469 @@ The processing workflow consists of three parts:
 """
 
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import os
+import threading
+import time
+import tracemalloc
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
-from functools import partial
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import List, Union
+from tempfile import TemporaryDirectory
+from typing import Iterable, List, Optional, Sequence, Tuple, Union
 
 import confuse
+import numpy as np
 from skimage import img_as_float, img_as_ubyte
 from skimage.color import label2rgb
 from skimage.exposure import rescale_intensity
 from skimage.io import imread, imsave
+from tifffile import TiffFile, imwrite
 from tqdm import tqdm
 
 from faim_wako_searchfirst import filter as fws_filter
-from faim_wako_searchfirst import sample, segment
+from faim_wako_searchfirst import plan, sample, segment
+from faim_wako_searchfirst.objects import ObjectTable
 
+# Same default as concurrent.futures.ThreadPoolExecutor
+_DEFAULT_MAX_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+# Label image, object table and (float RGB) preview, per pixel of the input image
+_WORKING_BYTES_PER_PIXEL = 64
+# Relative cost of filters evaluating a predicate per object
+_OBJECT_FILTER_COST = {"area": 0, "feature": 1, "solidity": 2, "intensity": 3}
+# Threads writing label images in the background, and label images waiting to be written at most
+_WRITER_THREADS = 2
+_MAX_PENDING_WRITES = 2 * _WRITER_THREADS
 
-def run(folder: Union[str, Path], configfile: Union[str, Path]):
-    """Analyse first pass of a Wako SearchFirst experiment."""
-    # Check if folder_path is valid
-    folder_path = Path(folder)
-    if not folder_path.is_dir():
-        raise ValueError(f"Invalid input folder: {folder}")
 
-    # Setup logging
-    logging.basicConfig(
-        filename=folder_path / (__name__ + ".log"),
-        format="%(asctime)s - %(name)s - [%(levelname)s] %(message)s",
-        level=logging.INFO,
-        # encoding="utf-8",
-    )
+def run(
+    folder: Union[str, Path],
+    configfile: Union[str, Path],
+    executor: Optional[Executor] = None,
+    on_error=None,
+) -> List[Path]:
+    """Analyse first pass of a Wako SearchFirst experiment.
+
+    :param folder: acquisition folder
+    :param configfile: config file
+    :param executor: long-lived executor to process the images on, instead of a new thread pool
+    :param on_error: called with the tif file and exception of each image that failed to process
+    :return: paths of the csv files written
+    """
+    process, tif_files, logger = _prepare_plate(folder, configfile)
+    execution = process.keywords["config"]["execution"].get(confuse.Optional(dict, default={}))
+    max_workers = execution.get("max_workers") or _DEFAULT_MAX_WORKERS
+
+    # Process
+    csv_paths = []
+    try:
+        with (
+            nullcontext(executor) if executor is not None else ThreadPoolExecutor(max_workers=max_workers) as pool,
+            _LabelWriter() as writer,
+        ):
+            _process_all(
+                pool,
+                ((partial(process, writer=writer), tif_file) for tif_file in tif_files),
+                on_done=lambda tif_file, csv_path: csv_paths.append(csv_path),
+                on_error=on_error,
+                total=len(tif_files),
+                max_in_flight=max_workers,
+                memory_limit=execution.get("memory_limit"),
+            )
+    finally:
+        _finish_plate(process, Path(folder), tif_files)
+    return sorted(csv_paths)
+
+
+def resample(
+    folder: Union[str, Path],
+    configfile: Union[str, Path],
+    executor: Optional[Executor] = None,
+) -> List[Path]:
+    """Re-run only the sample method of a previous run, from its saved label images.
+
+    Label images must have been saved by a run with the `save_labels` config section.
+    Neither the raw images are read, nor segment or filter methods applied,
+    so sampling parameters can be tuned quickly.
+
+    :param folder: acquisition folder
+    :param configfile: config file, with the sample method and its parameters
+    :param executor: long-lived executor to process the images on, instead of a new thread pool
+    :return: paths of the csv files written
+    """
+    process, tif_files, logger = _prepare_plate(folder, configfile, process_fn=_resample_tif)
+    logger.info("Re-sample from saved label images.")
+    execution = process.keywords["config"]["execution"].get(confuse.Optional(dict, default={}))
+    max_workers = execution.get("max_workers") or _DEFAULT_MAX_WORKERS
+    csv_paths = []
+    try:
+        with nullcontext(executor) if executor is not None else ThreadPoolExecutor(max_workers=max_workers) as pool:
+            _process_all(
+                pool,
+                ((process, tif_file) for tif_file in tif_files),
+                on_done=lambda tif_file, csv_path: csv_paths.append(csv_path),
+                total=len(tif_files),
+                max_in_flight=max_workers,
+            )
+    finally:
+        _finish_plate(process, Path(folder), tif_files)
+    return sorted(csv_paths)
+
+
+def estimate(
+    folder: Union[str, Path],
+    configfile: Union[str, Path],
+    n_samples: int = 3,
+    max_workers: Optional[int] = None,
+    seed: Optional[int] = None,
+) -> dict:
+    """Estimate runtime and peak memory of `run`, without writing into the acquisition folder.
+
+    The TIFF headers of all selected files are read, and a random sample of fields
+    is processed (into a temporary folder) one after the other, with timing of each stage,
+    and once more to measure peak memory. The first sample is processed once more beforehand,
+    so that one-time imports and model loading are not extrapolated to every field.
+    Per-pixel time and memory of the sample are then extrapolated to the whole plate.
+
+    :param folder: acquisition folder
+    :param configfile: config file
+    :param n_samples: number of fields to process
+    :param max_workers: number of worker threads to estimate for (default: from config)
+    :param seed: seed for the random selection of fields
+    :return: dict with the estimates, see `format_estimate`
+    """
+    folder_path, config, tif_files = _load_plate(folder, configfile)
+    if not tif_files:
+        raise ValueError(f"No matching files in {folder}.")
+    execution = config["execution"].get(confuse.Optional(dict, default={}))
+    max_workers = max_workers or execution.get("max_workers") or _DEFAULT_MAX_WORKERS
+    memory_limit = execution.get("memory_limit")
+
+    n_pixels = np.array([_read_header(tif_file)[0] for tif_file in tif_files])
+    rng = np.random.default_rng(seed)
+    samples = rng.choice(len(tif_files), size=min(n_samples, len(tif_files)), replace=False)
+
+    timings = {}
+    peak_memory = []
     logger = logging.getLogger(__name__)
+    with TemporaryDirectory() as tmp_dir:
+        # previews and label images are written next to the output folder, i.e. also into tmp_dir
+        output_folder = Path(tmp_dir) / folder_path.name
+        output_folder.mkdir()
+        # warm-up, e.g. importing cellpose and loading its model, is neither timed nor traced
+        _process_tif(tif_files[samples[0]], config=config, logger=logger, output_folder=output_folder)
+        for i in samples:
+            # tracing memory slows processing down, so time and memory are measured in separate passes
+            _process_tif(tif_files[i], config=config, logger=logger, output_folder=output_folder, timings=timings)
+            tracemalloc.start()
+            try:
+                _process_tif(tif_files[i], config=config, logger=logger, output_folder=output_folder)
+                peak_memory.append(tracemalloc.get_traced_memory()[1])
+            finally:
+                tracemalloc.stop()
+
+    sampled_pixels = n_pixels[samples].sum()
+    seconds_per_pixel = sum(timings.values()) / sampled_pixels
+    bytes_per_pixel = max(peak / n_pixels[i] for peak, i in zip(peak_memory, samples, strict=True))
+    largest_image = bytes_per_pixel * n_pixels.max()
+
+    # Threads only speed up processing up to the number of CPUs
+    cpu_count = os.cpu_count() or 1
+    recommended = min(cpu_count, len(tif_files))
+    if memory_limit is not None:
+        recommended = min(recommended, max(1, int(memory_limit * 2**20 // largest_image)))
+    return {
+        "n_files": len(tif_files),
+        "n_samples": len(samples),
+        "stage_seconds": {name: seconds / len(samples) for name, seconds in timings.items()},
+        "max_workers": max_workers,
+        "total_seconds": seconds_per_pixel * n_pixels.sum() / min(max_workers, cpu_count),
+        "peak_memory": largest_image * min(max_workers, len(tif_files)),
+        "recommended_workers": recommended,
+        # tracemalloc only sees allocations through Python, not those of torch
+        "memory_complete": config["process"]["segment"].get(str) != "cellpose",
+    }
+
+
+def format_estimate(result: dict) -> str:
+    """Format the result of `estimate` as a human-readable report."""
+    lines = [f"Estimate from {result['n_samples']} of {result['n_files']} fields:"]
+    lines.extend(f"  {name}: {seconds:.3f} s per field" for name, seconds in result["stage_seconds"].items())
+    lines.append(f"Total runtime with {result['max_workers']} workers: {result['total_seconds']:.1f} s")
+    lines.append(f"Peak memory with {result['max_workers']} workers: {result['peak_memory'] / 2**20:.0f} MB")
+    if not result["memory_complete"]:
+        lines.append("  (excluding memory allocated by torch for cellpose, which is not traced)")
+    lines.append(f"Recommended number of workers: {result['recommended_workers']}")
+    return "\n".join(lines)
 
-    # Read config
-    config_path = Path(configfile)
-    # source = confuse.YamlSource(config_path, base_for_paths=True)
-    # config = confuse.RootView(sources=[source])
-    config = confuse.Configuration("faim-wako-searchfirst", read=False)
-    config.set_file(config_path, base_for_paths=True)
+
+def run_batch(
+    folders: Sequence[Union[str, Path]],
+    configfiles: Union[str, Path, Sequence[Union[str, Path]]],
+    checkpoint: Optional[Union[str, Path]] = None,
+    max_workers: Optional[int] = None,
+    memory_limit: Optional[float] = None,
+):
+    """Analyse first passes of several Wako SearchFirst experiments on a shared worker pool.
+
+    Each plate gets its own log file and config copy, as with `run`.
+    If a 'checkpoint' file is given, each completed field is recorded in it,
+    and fields recorded by an earlier (interrupted) batch are skipped.
+
+    :param folders: acquisition folders, one per plate
+    :param configfiles: a single config file for all plates, or one config file per plate
+    :param checkpoint: file to record completed fields in
+    :param max_workers: number of worker threads shared by all plates
+        (default: the largest `execution: max_workers` of all plate configs)
+    :param memory_limit: approximate memory budget (in MB) for all images processed at the same time
+        (default: the smallest `execution: memory_limit` of all plate configs)
+    """
+    if isinstance(configfiles, (str, Path)):
+        configfiles = [configfiles] * len(folders)
+    if len(configfiles) != len(folders):
+        raise ValueError(f"Expected 1 or {len(folders)} config files, got {len(configfiles)}.")
+    checkpoint_path = Path(checkpoint) if checkpoint is not None else None
+    completed = set(checkpoint_path.read_text().splitlines()) if checkpoint_path and checkpoint_path.exists() else set()
+
+    jobs = []
+    plate_of = {}
+    remaining = {}
+    executions = []
+    for folder, configfile in zip(folders, configfiles, strict=True):
+        process, tif_files, logger = _prepare_plate(folder, configfile)
+        executions.append(process.keywords["config"]["execution"].get(confuse.Optional(dict, default={})))
+        pending = [tif_file for tif_file in tif_files if str(tif_file.resolve()) not in completed]
+        if len(pending) < len(tif_files):
+            logger.info(f"Resuming: skipping {len(tif_files) - len(pending)} completed files.")
+        remaining[process] = [Path(folder), tif_files, len(pending)]
+        plate_of.update(dict.fromkeys(pending, process))
+        jobs.extend((process, tif_file) for tif_file in pending)
+        if not pending:
+            _finish_batch_plate(process, Path(folder), tif_files)
+
+    def _on_finished(tif_file):
+        # failed fields count as well, so that each plate is finished exactly once
+        process = plate_of[tif_file]
+        plate_state = remaining[process]
+        plate_state[2] -= 1
+        if plate_state[2] == 0:
+            # label images of the plate are logged to its log file, which is closed when finishing
+            writer.wait(process.keywords["logger"])
+            _finish_batch_plate(process, *plate_state[:2])
+
+    def _on_done(tif_file, csv_path):
+        if checkpoint_path is not None:
+            with open(checkpoint_path, "a") as checkpoint_file:
+                checkpoint_file.write(f"{tif_file.resolve()}\n")
+        _on_finished(tif_file)
+
+    max_workers, memory_limit = _batch_limits(executions, max_workers, memory_limit)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor, _LabelWriter() as writer:
+        _process_all(
+            executor,
+            ((partial(process, writer=writer), tif_file) for process, tif_file in jobs),
+            on_done=_on_done,
+            on_error=lambda tif_file, error: _on_finished(tif_file),
+            total=len(jobs),
+            max_in_flight=max_workers,
+            memory_limit=memory_limit,
+        )
+
+
+def _finish_batch_plate(process: partial, folder_path: Path, tif_files: List[Path]):
+    """Finish a plate of a batch, logging any error instead of stopping the other plates."""
+    try:
+        _finish_plate(process, folder_path, tif_files)
+    except Exception as e:
+        logging.getLogger(__name__).error(f"Failed to finish {folder_path}: {e!r}")
+
+
+def _batch_limits(executions: List[dict], max_workers: Optional[int], memory_limit: Optional[float]):
+    """Return worker count and memory limit of a shared pool, from the plate 'executions' unless given explicitly.
+
+    The largest `max_workers` and the smallest `memory_limit` of all plates are used.
+    """
+    if max_workers is None:
+        max_workers = max((e["max_workers"] for e in executions if e.get("max_workers")), default=None)
+    if memory_limit is None:
+        memory_limit = min((e["memory_limit"] for e in executions if e.get("memory_limit")), default=None)
+    return max_workers or _DEFAULT_MAX_WORKERS, memory_limit
+
+
+def _prepare_plate(folder: Union[str, Path], configfile: Union[str, Path], process_fn=None):
+    """Set up logging and config for a plate, and select its files.
+
+    Files are processed with 'process_fn' (default: `_process_tif`).
+    """
+    folder_path, config, tif_files = _load_plate(folder, configfile)
+
+    # Setup logging
+    logger = _setup_logger(folder_path)
 
     # Copy config file to destination
     config_filename = datetime.now().strftime("%Y%m%d_%H%M_") + __name__.replace(".", "_") + "_config.yml"
     config_copy = folder_path / config_filename
     config_copy.write_text(config.dump())
 
+    logger.info(f"Found {len(tif_files)} matching files.")
+    return partial(process_fn or _process_tif, config=config, logger=logger), tif_files, logger
+
+
+def _load_plate(folder: Union[str, Path], configfile: Union[str, Path]):
+    """Read the config for a plate and select its files, without writing anything."""
+    # Check if folder_path is valid
+    folder_path = Path(folder)
+    if not folder_path.is_dir():
+        raise ValueError(f"Invalid input folder: {folder}")
+
+    # Read config
+    config_path = Path(configfile).resolve()
+    config = _read_config(config_path, config_path.stat().st_mtime_ns)
+
     # Select files
     tif_files = _select_files(
         folder=folder_path,
         **(config["file_selection"].get()),
     )
+    return folder_path, config, tif_files
 
-    logger.info(f"Found {len(tif_files)} matching files.")
 
-    # Process
-    process = partial(_process_tif, config=config, logger=logger)
-    with ThreadPoolExecutor() as executor:
-        futures = [executor.submit(process, tif_file) for tif_file in tif_files]
-        for _ in tqdm(as_completed(futures), total=len(futures)):
-            pass
-    logger.info("Done processing.")
+@lru_cache(maxsize=16)
+def _read_config(config_path: Path, mtime_ns: int) -> confuse.Configuration:
+    """Read a config file, cached as long as the file is not modified ('mtime_ns')."""
+    # source = confuse.YamlSource(config_path, base_for_paths=True)
+    # config = confuse.RootView(sources=[source])
+    config = confuse.Configuration("faim-wako-searchfirst", read=False)
+    config.set_file(config_path, base_for_paths=True)
+    return config
+
+
+def _setup_logger(folder_path: Path) -> logging.Logger:
+    """Return a logger writing into a log file in 'folder_path'."""
+    log_path = (folder_path / (__name__ + ".log")).resolve()
+    logger = logging.getLogger(f"{__name__}[{log_path}]")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    if not logger.handlers:
+        handler = logging.FileHandler(log_path, encoding="utf-8")
+        handler.setFormatter(logging.Formatter(f"%(asctime)s - {__name__} - [%(levelname)s] %(message)s"))
+        logger.addHandler(handler)
+    return logger
+
+
+def _finish_plate(process: partial, folder_path: Path, tif_files: List[Path]):
+    """Plan the second pass of a plate if configured, then close its log file.
+
+    Planning failures are logged, so that they do not replace the result of processing the fields.
+    """
+    config, logger = process.keywords["config"], process.keywords["logger"]
+    try:
+        if config["plan"].exists():
+            try:
+                plan_config = config["plan"].get(dict)
+                plan_config["field_positions"] = config["plan"]["field_positions"].as_filename()
+                plan.plate(
+                    tif_files,
+                    folder_path.parent / (folder_path.name + "_plan.csv"),
+                    **plan_config,
+                    logger=logger,
+                )
+            except Exception as e:
+                logger.error(f"Failed to plan the second pass: {e!r}")
+        logger.info("Done processing.")
+    finally:
+        for handler in logger.handlers[:]:
+            handler.close()
+            logger.removeHandler(handler)
+
+
+def _process_all(
+    executor: Executor,
+    jobs: Iterable,
+    on_done=None,
+    on_error=None,
+    total: Optional[int] = None,
+    max_in_flight: Optional[int] = None,
+    memory_limit: Optional[float] = None,
+):
+    """Run (process, tif_file) jobs on 'executor' and wait for their completion.
+
+    Jobs are taken from 'jobs' only when there is capacity, i.e. while fewer than 'max_in_flight'
+    jobs are running and the estimated memory of all running jobs stays within 'memory_limit' (in MB).
+    A single job is always allowed to run, even if it exceeds 'memory_limit' on its own.
+
+    Failures are logged to the logger of the respective process,
+    'on_done' is called with the tif file and result of each successfully processed job,
+    'on_error' with the tif file and exception of each failed job.
+    """
+    budget = memory_limit * 2**20 if memory_limit is not None else None
+    in_flight = {}
+    used = 0
+    jobs = _with_memory_estimates(jobs) if budget is not None else ((*job, 0) for job in jobs)
+    job = next(jobs, None)
+    with tqdm(total=total) as progress:
+        while job is not None or in_flight:
+            while job is not None:
+                process, tif_file, required = job
+                if in_flight and (
+                    (max_in_flight is not None and len(in_flight) >= max_in_flight)
+                    or (budget is not None and used + required > budget)
+                ):
+                    break
+                in_flight[executor.submit(process, tif_file)] = (process, tif_file, required)
+                used += required
+                job = next(jobs, None)
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                process, tif_file, required = in_flight.pop(future)
+                used -= required
+                progress.update()
+                if future.exception() is not None:
+                    process.keywords["logger"].error(f"Failed to process {tif_file.name}: {future.exception()!r}")
+                    if on_error is not None:
+                        on_error(tif_file, future.exception())
+                elif on_done is not None:
+                    on_done(tif_file, future.result())
+
+
+def _with_memory_estimates(jobs: Iterable):
+    """Yield (process, tif_file, estimated memory) for each (process, tif_file) job.
 
+    Files with unreadable header (e.g. still being written) are estimated like the largest file so far,
+    and are still processed, so that their failure is logged by the worker.
+    """
+    largest = 0
+    for process, tif_file in jobs:
+        try:
+            required = _estimate_memory(tif_file)
+        except Exception:
+            required = largest
+        largest = max(largest, required)
+        yield process, tif_file, required
 
-def _process_tif(tif_file, config, logger):
+
+def _estimate_memory(tif_file: Path) -> int:
+    """Estimate the peak memory (in bytes) required to process 'tif_file', based on its TIFF header."""
+    n_pixels, itemsize = _read_header(tif_file)
+    return n_pixels * (itemsize + _WORKING_BYTES_PER_PIXEL)
+
+
+def _read_header(tif_file: Path) -> Tuple[int, int]:
+    """Return number of pixels and bytes per pixel of 'tif_file', from its TIFF header."""
+    with TiffFile(tif_file) as tif:
+        series = tif.series[0]
+        return int(np.prod(series.shape)), series.dtype.itemsize
+
+
+def _process_tif(
+    tif_file,
+    config,
+    logger,
+    output_folder: Optional[Path] = None,
+    timings: Optional[dict] = None,
+    writer: Optional["_LabelWriter"] = None,
+):
     # Setup
     # Segment
     segment_method = config["process"]["segment"].get(str)
@@ -82,7 +482,7 @@ def _process_tif(tif_file, config, logger):
     segment_fn = getattr(segment, segment_method)
 
     # Filter
-    filter_methods = config["process"]["filter"].as_str_seq()
+    filter_methods = _order_filters(config["process"]["filter"].as_str_seq(), config)
     filter_funcs = {f: getattr(fws_filter, f) for f in filter_methods}
 
     # Sample
@@ -90,36 +490,174 @@ def _process_tif(tif_file, config, logger):
     sample_config = config[sample_method].get(confuse.Optional(dict, default={}))
     sample_fn = getattr(sample, sample_method)
 
+    output_folder = output_folder if output_folder is not None else tif_file.parent
+
     # Read image
-    img = imread(tif_file)
+    with _stage(timings, "read"):
+        img = imread(tif_file)
 
     # Segment
-    labels = segment_fn(
-        img,
-        **segment_config,
-        logger=logger,
-    )
+    with _stage(timings, "segment"):
+        labels = segment_fn(
+            img,
+            **segment_config,
+            logger=logger,
+        )
+        objects = ObjectTable(labels)
 
     # Filter
     for name, func in filter_funcs.items():
+        if len(objects) == 0:
+            logger.info(f"No objects left in {tif_file.name}, skipping remaining filters.")
+            break
         conf = config[name].get(confuse.Optional(dict, default={}))
-        func(
-            tif_file,
-            labels,
-            **conf,
-        )
+        with _stage(timings, name):
+            func(
+                tif_file,
+                labels,
+                **conf,
+                objects=objects,
+            )
 
     # Sample
     # mask -> csv
+    csv_path = output_folder / (tif_file.stem + ".csv")
+    with _stage(timings, "sample"):
+        sample_fn(
+            labels,
+            csv_path,
+            **sample_config,
+            objects=objects,
+        )
+
+    # mask + image -> preview
+    with _stage(timings, "preview"):
+        _save_segmentation_image(output_folder, tif_file.name, img, labels)
+
+    # mask -> label image, written in the background if a writer is given
+    if config["save_labels"].exists():
+        save = partial(
+            _save_label_image,
+            output_folder,
+            tif_file.name,
+            labels,
+            **config["save_labels"].get(confuse.Optional(dict, default={})),
+        )
+
+        def _save_in_background():
+            # logged within the write, so that it is done before the plate's log file is closed
+            try:
+                save()
+            except Exception as e:
+                logger.error(f"Failed to save labels of {tif_file.name}: {e!r}")
+
+        with _stage(timings, "save_labels"):
+            if writer is None:
+                save()
+            else:
+                writer.submit(_save_in_background, logger)
+    return csv_path
+
+
+class _LabelWriter:
+    """Write label images in background threads, with a limited number of pending writes.
+
+    Submitting blocks while 'max_pending' writes are pending, so that label images cannot pile up
+    (outside of the memory budget of the workers) when writing is slower than processing.
+    Pending writes are tracked per plate logger, so that a plate is only finished once its writes are done.
+    """
+
+    def __init__(self, max_workers: int = _WRITER_THREADS, max_pending: int = _MAX_PENDING_WRITES):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._executor.shutdown(wait=True)
+
+    def submit(self, fn, logger) -> Future:
+        """Run 'fn' in the background, after waiting for a free slot."""
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(fn)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending.setdefault(logger, set()).add(future)
+        future.add_done_callback(partial(self._release, logger))
+        return future
+
+    def _release(self, logger, future: Future):
+        with self._lock:
+            self._pending[logger].discard(future)
+        self._slots.release()
+
+    def wait(self, logger):
+        """Wait until all writes submitted with 'logger' are done."""
+        with self._lock:
+            futures = list(self._pending.get(logger, ()))
+        wait(futures)
+
+
+def _resample_tif(tif_file, config, logger):
+    sample_method = config["process"]["sample"].get(str)
+    sample_config = config[sample_method].get(confuse.Optional(dict, default={}))
+    sample_fn = getattr(sample, sample_method)
+
+    labels_path = tif_file.parent.parent / (tif_file.parent.name + "_labels") / (tif_file.stem + ".tif")
+    if not labels_path.exists():
+        raise FileNotFoundError(f"No saved label image for {tif_file.name}, run with 'save_labels' first.")
+    labels = imread(labels_path)
+
     csv_path = tif_file.parent / (tif_file.stem + ".csv")
     sample_fn(
         labels,
         csv_path,
         **sample_config,
+        objects=ObjectTable(labels),
     )
+    return csv_path
 
-    # mask + image -> preview
-    _save_segmentation_image(tif_file.parent, tif_file.name, img, labels)
+
+def _order_filters(filter_methods: List[str], config) -> List[str]:
+    """Reorder consecutive object-level filters by cost, cheapest first.
+
+    Object-level filters evaluate a predicate per object that does not depend on other objects,
+    so they can be applied in any order. Applying cheap predicates first means that costly properties
+    (e.g. convex hulls, or reading another channel) are only computed for the remaining objects.
+    Spatial filters (e.g. dilate) keep their position in the chain.
+    """
+    ordered = []
+    group = []
+    for name in [*filter_methods, None]:
+        conf = config[name].get(confuse.Optional(dict, default={})) if name is not None else {}
+        # background correction depends on the unlabeled pixels, i.e. on objects removed before
+        if name in _OBJECT_FILTER_COST and not conf.get("background_correction", False):
+            group.append(name)
+            continue
+        ordered.extend(sorted(group, key=_OBJECT_FILTER_COST.get))
+        group = []
+        if name is not None:
+            ordered.append(name)
+    return ordered
+
+
+@contextmanager
+def _stage(timings: Optional[dict], name: str):
+    """Add the time spent in the context to 'timings[name]', if 'timings' is given."""
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
 
 
 def _select_files(
@@ -139,6 +677,19 @@ def _save_segmentation_image(folder_path, filename, img, labels):
     imsave(destination_folder / (Path(filename).stem + ".png"), img_as_ubyte(preview))
 
 
+def _save_label_image(folder_path, filename, labels, compression: str = "zlib"):
+    """Save label image as compressed TIFF into separate folder."""
+    destination_folder = folder_path.parent / (folder_path.name + "_labels")
+    destination_folder.mkdir(exist_ok=True)
+    dtype = np.uint16 if labels.max(initial=0) <= np.iinfo(np.uint16).max else np.uint32
+    imwrite(
+        destination_folder / (Path(filename).stem + ".tif"),
+        labels.astype(dtype, copy=False),
+        compression=None if compression == "none" else compression,
+        predictor=compression != "none",
+    )
+
+
 # def process(
 #         folder: Path,
 #         file_selection_params: dict,
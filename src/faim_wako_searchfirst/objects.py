@@ -0,0 +1,137 @@
+# SPDX-FileCopyrightText: 2025 Friedrich Miescher Institute for Biomedical Research (FMI), Basel (Switzerland)
+#
+# SPDX-License-Identifier: MIT
+
+"""Per-image table of labeled objects, shared between filters and samplers.
+
+The table is created once after segmentation; objects are located in a single pass over the label image
+and measured on their bounding box crops. It keeps label, bounding box, area and centroid of every object,
+and computes costly properties (e.g. solidity) lazily per object on its bounding box crop.
+Filters keep the table in sync with the label image, so that samplers can consume it
+without scanning the full image again.
+"""
+
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+from numpy import ndarray
+from scipy.ndimage import find_objects
+from skimage.measure import regionprops
+
+# Class of the objects returned by `regionprops`, to validate property names
+_REGION_PROPERTIES = type(regionprops(np.ones((1, 1), dtype=np.uint8))[0])
+
+
+class ObjectTable:
+    """Label, bounding box, area and centroid of all objects in a label image.
+
+    The table refers to (and modifies) the label image it was created from.
+    Bounding boxes follow the `regionprops` convention `(min_row, min_col, max_row, max_col)`.
+    """
+
+    def __init__(self, labels: ndarray):
+        """Measure all objects in 'labels'."""
+        self.labels = labels
+        self.label = np.zeros(0, dtype=np.int64)
+        self.bbox = np.zeros((0, 4), dtype=np.int64)
+        self.area = np.zeros(0, dtype=np.int64)
+        self.centroid = np.zeros((0, 2), dtype=np.float64)
+        self._regions: Dict[int, object] = {}
+        self._measure_all()
+
+    def __len__(self):
+        """Return the number of objects."""
+        return len(self.label)
+
+    def _measure_all(self):
+        slices = find_objects(self.labels)
+        present = [i for i, s in enumerate(slices) if s is not None]
+        self.label = np.array(present, dtype=np.int64) + 1
+        self.bbox = np.array(
+            [[s[0].start, s[1].start, s[0].stop, s[1].stop] for s in (slices[i] for i in present)],
+            dtype=np.int64,
+        ).reshape(-1, 4)
+        self.area = np.zeros(len(self.label), dtype=np.int64)
+        self.centroid = np.zeros((len(self.label), 2), dtype=np.float64)
+        self._regions = {}
+        # area and centroid on the bounding box crops, to avoid full-image temporaries
+        self.update()
+
+    def _index(self, label_values: Iterable[int]) -> ndarray:
+        return np.flatnonzero(np.isin(self.label, np.asarray(list(label_values), dtype=np.int64)))
+
+    def remove(self, label_values: Iterable[int]):
+        """Remove objects from the table and set their pixels to zero in the label image."""
+        indices = self._index(label_values)
+        for i in indices:
+            min_row, min_col, max_row, max_col = self.bbox[i]
+            crop = self.labels[min_row:max_row, min_col:max_col]
+            crop[crop == self.label[i]] = 0
+            self._regions.pop(int(self.label[i]), None)
+        self._drop(indices)
+
+    def keep(self, mask: ndarray):
+        """Keep only the objects where 'mask' is true, remove all others."""
+        self.remove(self.label[~np.asarray(mask, dtype=bool)])
+
+    def _drop(self, indices: ndarray):
+        keep = np.ones(len(self.label), dtype=bool)
+        keep[indices] = False
+        self.label = self.label[keep]
+        self.bbox = self.bbox[keep]
+        self.area = self.area[keep]
+        self.centroid = self.centroid[keep]
+
+    def update(self, label_values: Optional[Iterable[int]] = None, padding: int = 0):
+        """Re-measure objects after their pixels were modified in the label image.
+
+        Only the bounding box of each object, enlarged by 'padding' pixels, is examined,
+        so 'padding' must cover any growth of the objects since the last measurement.
+        Objects that no longer exist are dropped from the table.
+        If 'label_values' is None, all objects are re-measured.
+        """
+        indices = np.arange(len(self.label)) if label_values is None else self._index(label_values)
+        vanished = []
+        for i in indices:
+            label_value = self.label[i]
+            self._regions.pop(int(label_value), None)
+            crop = self.slice(i, padding)
+            rows, cols = np.nonzero(self.labels[crop] == label_value)
+            if len(rows) == 0:
+                vanished.append(i)
+                continue
+            rows += crop[0].start
+            cols += crop[1].start
+            self.bbox[i] = [rows.min(), cols.min(), rows.max() + 1, cols.max() + 1]
+            self.area[i] = len(rows)
+            self.centroid[i] = [rows.mean(), cols.mean()]
+        self._drop(np.array(vanished, dtype=np.int64))
+
+    def slice(self, index: int, padding: int = 0) -> Tuple[slice, slice]:
+        """Return the bounding box of the object at 'index', enlarged by 'padding' and clipped to the image."""
+        height, width = self.labels.shape
+        min_row, min_col, max_row, max_col = self.bbox[index]
+        return (
+            slice(max(min_row - padding, 0), min(max_row + padding, height)),
+            slice(max(min_col - padding, 0), min(max_col + padding, width)),
+        )
+
+    def region(self, label_value: int):
+        """Return the (cached) `regionprops` of a single object, computed on its bounding box crop."""
+        label_value = int(label_value)
+        if label_value not in self._regions:
+            i = self._index([label_value])[0]
+            min_row, min_col, max_row, max_col = self.bbox[i]
+            crop = self.labels[min_row:max_row, min_col:max_col]
+            single = np.where(crop == label_value, crop, 0)
+            self._regions[label_value] = regionprops(single, offset=(min_row, min_col))[0]
+        return self._regions[label_value]
+
+    def property(self, name: str) -> ndarray:
+        """Return the values of a `regionprops` property for all objects.
+
+        Values are computed lazily per object and cached until the object changes.
+        """
+        if not hasattr(_REGION_PROPERTIES, name):
+            raise AttributeError(f"'regionprops' object has no attribute '{name}'")
+        return np.array([getattr(self.region(label_value), name) for label_value in self.label])
@@ -0,0 +1,154 @@
+# SPDX-FileCopyrightText: 2025 Friedrich Miescher Institute for Biomedical Research (FMI), Basel (Switzerland)
+#
+# SPDX-License-Identifier: MIT
+
+"""Plate-level planning of the second pass acquisition.
+
+The per-field csv files written by the sample methods contain pixel coordinates within each field.
+Planning maps them to stage coordinates, merges tiles that are duplicated across overlapping fields,
+and orders the remaining tiles along a short stage travel path.
+"""
+
+import csv
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+from numpy import ndarray
+from scipy.spatial import cKDTree
+from tifffile import TiffFile
+
+
+def plate(
+    tif_files: Sequence[Path],
+    output_path: Path,
+    field_positions: Union[str, Path],
+    pixel_size: float,
+    mag_first_pass: float,
+    mag_second_pass: float,
+    overlap_ratio: float = 0.0,
+    merge_ratio: float = 0.5,
+    logger=None,
+):
+    """Write all second pass tiles of a plate in stage coordinates, in acquisition order.
+
+    :param tif_files: first pass images, with their csv files written by a sample method
+    :param output_path: plate-level csv file with rows (index, field, label, stage x, stage y)
+    :param field_positions: csv file with rows (file name, stage x, stage y) of each field center
+    :param pixel_size: size of a first pass pixel in stage units; image and stage axes are assumed to be aligned
+    :param mag_first_pass: magnification of the first pass
+    :param mag_second_pass: magnification of the second pass
+    :param overlap_ratio: overlap of neighboring second pass tiles
+    :param merge_ratio: tiles closer than this fraction of a tile (along both axes) are merged
+    :param logger:
+    """
+    positions = read_field_positions(field_positions)
+    fields, labels, points = [], [], []
+    tile_size = None
+    for tif_file in tif_files:
+        csv_path = tif_file.parent / (tif_file.stem + ".csv")
+        if tif_file.stem not in positions:
+            if logger is not None:
+                logger.warning(f"No stage position for {tif_file.name}, skipping it in the plan.")
+            continue
+        if not csv_path.exists():
+            continue
+        with TiffFile(tif_file) as tif:
+            height, width = tif.series[0].shape[-2:]
+        factor = mag_first_pass / mag_second_pass * (1.0 - overlap_ratio) * pixel_size
+        tile_size = np.array([width * factor, height * factor])
+        center_x, center_y = positions[tif_file.stem]
+        for label_value, x, y in _read_points(csv_path):
+            fields.append(tif_file.stem)
+            labels.append(label_value)
+            points.append(
+                [
+                    center_x + (x - width / 2) * pixel_size,
+                    center_y + (y - height / 2) * pixel_size,
+                ]
+            )
+
+    points = np.array(points, dtype=float).reshape(-1, 2)
+    keep = merge_duplicates(points, tile_size * merge_ratio) if len(points) > 0 else np.zeros(0, dtype=int)
+    order = keep[shortest_path(points[keep])]
+    if logger is not None:
+        logger.info(f"Planned {len(order)} second pass tiles ({len(points) - len(order)} duplicates merged).")
+
+    with open(output_path, "w", newline="") as csv_file:
+        c = csv.writer(csv_file)
+        for count, i in enumerate(order):
+            c.writerow([count, fields[i], labels[i], *points[i]])
+
+
+def read_field_positions(path: Union[str, Path]) -> Dict[str, Tuple[float, float]]:
+    """Read stage positions of field centers, keyed by file name without extension."""
+    with open(path, "r", newline="") as csv_file:
+        return {Path(row[0]).stem: (float(row[1]), float(row[2])) for row in csv.reader(csv_file) if row}
+
+
+def _read_points(csv_path: Path) -> List[Tuple[str, float, float]]:
+    with open(csv_path, "r", newline="") as csv_file:
+        return [(row[0], float(row[1]), float(row[2])) for row in csv.reader(csv_file) if row]
+
+
+def merge_duplicates(points: ndarray, distance: ndarray) -> ndarray:
+    """Return indices of the points to keep, dropping points closer than 'distance' (along each axis) to a kept one.
+
+    Points are visited in order, and a point is only dropped if it duplicates a point that is kept.
+    Merging is not transitive, so that chains of close points do not lose coverage.
+    """
+    tree = cKDTree(points / distance)
+    kept = np.zeros(len(points), dtype=bool)
+    for i, neighbors in enumerate(tree.query_ball_point(tree.data, r=1.0, p=np.inf)):
+        kept[i] = not kept[[j for j in neighbors if j < i]].any()
+    return np.flatnonzero(kept)
+
+
+def shortest_path(points: ndarray, max_iterations: int = 100) -> ndarray:
+    """Return a short open path visiting all 'points', starting at the first one.
+
+    The path is constructed with the nearest neighbor heuristic and improved by 2-opt moves.
+    """
+    n = len(points)
+    if n < 3:
+        return np.arange(n)
+    visited = np.zeros(n, dtype=bool)
+    order = np.empty(n, dtype=int)
+    order[0] = 0
+    visited[0] = True
+    for k in range(1, n):
+        distances = np.linalg.norm(points - points[order[k - 1]], axis=1)
+        distances[visited] = np.inf
+        order[k] = np.argmin(distances)
+        visited[order[k]] = True
+    return _two_opt(points, order, max_iterations)
+
+
+def _two_opt(points: ndarray, order: ndarray, max_iterations: int) -> ndarray:
+    """Improve an open path by reversing segments, as long as this shortens it."""
+    n = len(order)
+    for _ in range(max_iterations):
+        improved = False
+        for i in range(1, n - 1):
+            path = points[order]
+            a, b = path[i - 1], path[i]
+            # reverse order[i:j+1]: replace edges (i-1, i) and (j, j+1) by (i-1, j) and (i, j+1)
+            c, d = path[i:-1], path[i + 1 :]
+            delta = (
+                np.linalg.norm(c - a, axis=1)
+                + np.linalg.norm(d - b, axis=1)
+                - np.linalg.norm(b - a)
+                - np.linalg.norm(d - c, axis=1)
+            )
+            # reversing the tail of an open path only replaces edge (i-1, i) by (i-1, n-1)
+            delta_tail = np.linalg.norm(path[-1] - a) - np.linalg.norm(b - a)
+            j = np.argmin(delta)
+            if delta[j] < -1e-9 and delta[j] <= delta_tail:
+                order[i : i + j + 1] = order[i : i + j + 1][::-1]
+                improved = True
+            elif delta_tail < -1e-9:
+                order[i:] = order[i:][::-1]
+                improved = True
+        if not improved:
+            break
+    return order
@@ -4,23 +4,28 @@
 
 """Collection of methods to sample a label image and write coordinates into a csv file.
 
-Each method must accept a label image and an output file path as first two arguments.
+Each method must accept a label image and an output file path as first two arguments,
+and an optional `objects` keyword argument, an `ObjectTable` of the label image.
 """
 
 import csv
 from pathlib import Path
+from typing import Optional
 
 import numpy as np
 from numpy import ndarray
 from skimage.filters.rank import maximum
-from skimage.measure import block_reduce, label, regionprops
+from skimage.measure import block_reduce, label
 from skimage.morphology import footprint_rectangle
 
+from faim_wako_searchfirst.objects import ObjectTable
+
 
 def dense_grid(
     labels: ndarray,
     output_path: Path,
     binning_factor: int = 50,
+    objects: Optional[ObjectTable] = None,
 ):
     """Save densely sampled grid positions for object hits."""
     downscaled = block_reduce(
@@ -48,6 +53,7 @@ def grid_overlap(
     mag_first_pass,
     mag_second_pass,
     overlap_ratio: float = 0.0,
+    objects: Optional[ObjectTable] = None,
 ):
     """Save grid positions of the tiles that contain objects."""
     factor = mag_first_pass / mag_second_pass
@@ -73,13 +79,13 @@ def grid_overlap(
                     count += 1
 
 
-def centers(labeled_img, path):
+def centers(labeled_img, path, objects: Optional[ObjectTable] = None):
     """Save center position of each object in 'labeled_img'."""
-    regions = regionprops(labeled_img)
+    objects = objects if objects is not None else ObjectTable(labeled_img)
     with open(path, "w", newline="") as csv_file:
         c = csv.writer(csv_file)
-        for region in regions:
-            c.writerow([region.label, *reversed(region.centroid)])
+        for label_value, centroid in zip(objects.label, objects.centroid, strict=True):
+            c.writerow([label_value, *reversed(centroid)])
 
 
 def _filter_points(points, weights, y_threshold, x_threshold):
@@ -103,15 +109,14 @@ def _sample_grid_on_regions(
     labeled_img: ndarray,
     tile_size_y: float,
     tile_size_x: float,
+    objects: Optional[ObjectTable] = None,
 ):
-    props = regionprops(label_image=labeled_img)
+    objects = objects if objects is not None else ObjectTable(labeled_img)
     labels = []
     coordinates = []
     areas = []
     # loop over labels (and sort by descending size?)
-    for p in props:
-        # compute bounding box of label
-        bbox = p.bbox
+    for label_value, bbox, area in zip(objects.label, objects.bbox, objects.area, strict=True):
         n_tiles_y = int(np.ceil((bbox[2] - bbox[0]) / tile_size_y))
         n_tiles_x = int(np.ceil((bbox[3] - bbox[1]) / tile_size_x))
         # compute center of bounding box
@@ -132,12 +137,12 @@ def _sample_grid_on_regions(
             x_min = max(0, int(x - tile_size_x / 2))
             x_max = min(labeled_img.shape[1], int(x + tile_size_x / 2))
 
-            if np.any(labeled_img[y_min:y_max, x_min:x_max] == p.label):
+            if np.any(labeled_img[y_min:y_max, x_min:x_max] == label_value):
                 valid_points.append((y, x))
 
         coordinates.extend(valid_points)
-        areas.extend([p.area] * len(valid_points))
-        labels.extend([p.label] * len(valid_points))
+        areas.extend([area] * len(valid_points))
+        labels.extend([label_value] * len(valid_points))
     return coordinates, areas, labels
 
 
@@ -147,6 +152,7 @@ def object_centered_grid(
     mag_first_pass: float,
     mag_second_pass: float,
     overlap_ratio: float = 0.0,
+    objects: Optional[ObjectTable] = None,
 ):
     """Sample each labeled object with a centered grid of tiles.
 
@@ -166,6 +172,7 @@ def object_centered_grid(
         labeled_img=labeled_img,
         tile_size_y=tile_size_y,
         tile_size_x=tile_size_x,
+        objects=objects,
     )
 
     # filter overlapping coordinates
@@ -191,6 +198,7 @@ def region_centered_grid(
     mag_first_pass: float,
     mag_second_pass: float,
     overlap_ratio: float = 0.0,
+    objects: Optional[ObjectTable] = None,
 ):
     """Sample optimal grid for each region of objects that are close to each other.
 
@@ -6,18 +6,22 @@
 
 Each method must accept an input image as first argument,
 and must return a label image.
+Heavy backends (e.g. cellpose and torch) are imported only when their method is called.
 """
 
 import logging
+import threading
 from pathlib import Path
 from typing import Union
 
 import numpy as np
-from cellpose import models
 from scipy.ndimage import binary_fill_holes
 from skimage.filters import gaussian
 from skimage.measure import label
 
+# Loaded models, per thread: a model is not shared between threads, so that they evaluate concurrently
+_thread_models = threading.local()
+
 
 def threshold(
     img,
@@ -62,9 +66,7 @@ def cellpose(
     :return: a label image representing the detected objects
     """
     logger.info(f"Load cellpose model: {pretrained_model}")
-    model: models.CellposeModel = models.CellposeModel(
-        pretrained_model=pretrained_model,
-    )
+    model = _load_cellpose_model(str(pretrained_model))
     mask, _, _ = model.eval(
         img,
         channels=[0, 0],
@@ -72,3 +74,16 @@ def cellpose(
         **kwargs,
     )
     return mask
+
+
+def _load_cellpose_model(pretrained_model: str):
+    """Load a cellpose model once per thread, and keep it for later calls in the same thread."""
+    from cellpose import models
+
+    cache = _thread_models.__dict__.setdefault("models", {})
+    if pretrained_model not in cache:
+        cache[pretrained_model] = models.CellposeModel(
+            pretrained_model=pretrained_model,
+        )
+    model: models.CellposeModel = cache[pretrained_model]
+    return model
@@ -0,0 +1,139 @@
+# SPDX-FileCopyrightText: 2025 Friedrich Miescher Institute for Biomedical Research (FMI), Basel (Switzerland)
+#
+# SPDX-License-Identifier: MIT
+
+"""Test faim_wako_searchfirst.daemon module."""
+
+import shutil
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing.connection import AuthenticationError, Client
+from pathlib import Path
+
+import pytest
+
+from faim_wako_searchfirst import main
+from faim_wako_searchfirst.daemon import AUTHKEY_VARIABLE, parse_address, read_authkey, serve, shutdown, status, submit
+
+
+@contextmanager
+def _serving():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        port = s.getsockname()[1]
+    address = ("localhost", port)
+    server = threading.Thread(target=serve, kwargs={"address": address, "max_workers": 2})
+    server.start()
+    for _ in range(100):
+        try:
+            status(address)
+            break
+        except ConnectionRefusedError:
+            time.sleep(0.05)
+    yield address
+    shutdown(address)
+    server.join()
+
+
+@pytest.fixture
+def _address(monkeypatch):
+    monkeypatch.setenv(AUTHKEY_VARIABLE, "test-secret")
+    with _serving() as address:
+        yield address
+
+
+def test_submit(_address, tmp_path):
+    """Test processing several plates on a running service."""
+    testset_path = Path("tests/resources/TestSet")
+    for name in ("plate1", "plate2"):
+        data_path = shutil.copytree(testset_path, tmp_path / name / "TestSet")
+        result = submit(data_path, "config.yml", address=_address)
+        assert result["status"] == "done"
+        assert result["csv_files"] == [str(data_path / "TestSet_D07_T0001F002L01A02Z01C01.csv")]
+        assert Path(result["csv_files"][0]).exists()
+
+    result = submit(tmp_path / "missing", "config.yml", address=_address)
+    assert result["status"] == "failed"
+    assert status(_address)["running"] == []
+
+
+def test_submit_with_failed_fields(_address, tmp_path):
+    """Test that failed fields are reported, and jobs without any csv file fail."""
+    data_path = shutil.copytree(Path("tests/resources/TestSet"), tmp_path / "TestSet")
+    broken = data_path / "TestSet_D07_T0002F001L01A01Z01C01.tif"
+    broken.write_bytes(b"not a tif")
+    result = submit(data_path, "config.yml", address=_address)
+    assert result["status"] == "done"
+    assert result["failed_files"] == [str(broken)]
+
+    (data_path / "TestSet_D07_T0001F002L01A02Z01C01.tif").write_bytes(b"not a tif")
+    result = submit(data_path, "config.yml", address=_address)
+    assert result["status"] == "failed"
+    assert len(result["failed_files"]) == 2
+
+
+def test_invalid_clients(_address):
+    """Test that invalid connections and requests do not stop the service."""
+    with pytest.raises(AuthenticationError):
+        Client(_address, authkey=b"wrong")
+    with Client(_address, authkey=b"test-secret") as connection:
+        connection.send({"command": "process"})
+        assert connection.recv()["status"] == "failed"
+    with Client(_address, authkey=b"test-secret") as connection:
+        connection.send("not a dict")
+    Client(_address, authkey=b"test-secret").close()
+    assert status(_address)["status"] == "status"
+
+
+def test_read_authkey(tmp_path, monkeypatch):
+    """Test that a shared key is required."""
+    monkeypatch.delenv(AUTHKEY_VARIABLE, raising=False)
+    with pytest.raises(ValueError, match="No authentication key"):
+        read_authkey()
+    monkeypatch.setenv(AUTHKEY_VARIABLE, "from-env")
+    assert read_authkey() == b"from-env"
+    key_file = tmp_path / "authkey"
+    key_file.write_text("from-file\n")
+    assert read_authkey(key_file) == b"from-file"
+
+
+def test_parse_address():
+    """Test parsing of service addresses."""
+    assert parse_address("6001") == ("localhost", 6001)
+    assert parse_address("127.0.0.1:6002") == ("127.0.0.1", 6002)
+
+
+def test_jobs_one_at_a_time(monkeypatch):
+    """Test that concurrently submitted jobs are processed one after the other."""
+    monkeypatch.setenv(AUTHKEY_VARIABLE, "test-secret")
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def _run(folder, configfile, executor, on_error):
+        with lock:
+            running.append(folder)
+            peak.append(len(running))
+        time.sleep(0.1)
+        with lock:
+            running.remove(folder)
+        return [Path(folder) / "field.csv"]
+
+    monkeypatch.setattr(main, "run", _run)
+    with _serving() as address:
+        clients = [
+            threading.Thread(target=submit, args=(f"plate{i}", "config.yml"), kwargs={"address": address})
+            for i in range(3)
+        ]
+        for client in clients:
+            client.start()
+        time.sleep(0.05)
+        state = status(address)
+        assert len(state["running"]) == 1
+        assert len(state["queued"]) == 2
+        for client in clients:
+            client.join()
+    assert max(peak) == 1
+    assert len(peak) == 3
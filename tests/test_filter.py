@@ -9,8 +9,11 @@ from pathlib import Path
 import numpy as np
 import pytest
 from skimage.io import imread
+from skimage.measure import regionprops
+from skimage.segmentation import expand_labels
 
-from faim_wako_searchfirst.filter import border, dilate, feature
+from faim_wako_searchfirst.filter import _filter_objects_by_intensity, border, bounding_box, dilate, feature, intensity
+from faim_wako_searchfirst.objects import ObjectTable
 
 
 @pytest.fixture
@@ -53,3 +56,71 @@ def test_dilate(_label_image: np.ndarray):
         pixel_distance=5.0,
     )
     assert np.sum(labels[labels == 1]) == 2803
+
+
+def test_spatial_filters_on_object_table():
+    """Test bounding box and cropped dilation of few objects in a large frame against full-frame results."""
+    labels = np.zeros((1000, 1200), dtype=np.uint16)
+    labels[100:140, 100:150] = 1
+    labels[130:160, 152:200] = 2
+    labels[600:700, 1150:1200] = 3
+    labels[900:960, 500:520] = 4
+    expected = labels.copy()
+    expected[:, 1170:] = 0
+    expected = expand_labels(expected, distance=7.5)
+
+    objects = ObjectTable(labels)
+    bounding_box(tif_file=None, labels=labels, min_x=0, min_y=0, max_x=1170, max_y=1000, objects=objects)
+    dilate(tif_file=None, labels=labels, pixel_distance=7.5, objects=objects)
+    assert np.array_equal(labels, expected)
+    assert objects.area.tolist() == [r.area for r in regionprops(expected)]
+
+
+@pytest.mark.parametrize(
+    ("statistic", "reference"),
+    [
+        ("mean", lambda r: r.intensity_mean),
+        ("median", lambda r: np.median(r.image_intensity[r.image])),
+        ("min", lambda r: r.intensity_min),
+        ("max", lambda r: r.intensity_max),
+        ("integrated", lambda r: r.intensity_mean * r.area),
+    ],
+)
+def test_intensity_statistics(_label_image: np.ndarray, statistic, reference):
+    """Test vectorized intensity statistics against regionprops."""
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 255, size=_label_image.shape).astype(np.uint8)
+    values = {r.label: reference(r) for r in regionprops(_label_image, img)}
+    threshold = np.median(list(values.values()))
+    labels = _label_image.copy()
+    _filter_objects_by_intensity(labels, img, min_intensity=threshold, statistic=statistic)
+    assert np.unique(labels).tolist() == [0] + [k for k, v in values.items() if v >= threshold]
+
+
+def test_intensity_multi_channel(_label_image: np.ndarray):
+    """Test intensity filtering over several channels, with background correction."""
+    img1 = np.where(_label_image > 0, 10 * _label_image.astype(float), 5.0)
+    img2 = np.where((_label_image > 0) & (_label_image != 2), 100.0, 0.0)
+    labels = _label_image.copy()
+    _filter_objects_by_intensity(
+        labels,
+        [img1, img2],
+        min_intensity=[10, 50],
+        max_intensity=[30, np.inf],
+        background_correction=True,
+    )
+    # background-corrected mean in img1: 5, 15, 25, 35; label 2 is dark in img2
+    assert np.unique(labels).tolist() == [0, 3]
+
+
+def test_intensity_skips_read_without_objects(tmp_path):
+    """Test that no other channel is read (or even looked up) if no objects are left."""
+    labels = np.zeros((10, 10), dtype=np.uint16)
+    intensity(
+        tif_file=tmp_path / "missing_A01_T0001F001L01A01Z01C01.tif",
+        labels=labels,
+        target_channel="C02",
+        min_intensity=0,
+        objects=ObjectTable(labels),
+    )
+    assert not labels.any()
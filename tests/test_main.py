@@ -5,16 +5,34 @@
 """Test faim_wako_searchfirst module."""
 
 import csv
+import logging
 import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 
+import confuse
 import numpy as np
 import pandas as pd
 import pytest
 from skimage.io import imread
 
+from faim_wako_searchfirst import main, segment
 from faim_wako_searchfirst.filter import area, bounding_box, solidity
-from faim_wako_searchfirst.main import run
+from faim_wako_searchfirst.main import (
+    _estimate_memory,
+    _LabelWriter,
+    _order_filters,
+    _process_all,
+    estimate,
+    format_estimate,
+    resample,
+    run,
+    run_batch,
+)
 from faim_wako_searchfirst.sample import centers, dense_grid, grid_overlap
 from faim_wako_searchfirst.segment import threshold
 
@@ -47,6 +65,278 @@ def test_run(_data_path):
     assert sum(1 for _ in segmentation_folder.glob("*")) == 1
 
 
+def test_run_save_labels(_data_path, tmp_path):
+    """Test persisting the final label image of each field."""
+    configfile = tmp_path / "config.yml"
+    configfile.write_text(Path("config.yml").read_text() + "\nsave_labels:\n    compression: zlib\n")
+    run(_data_path, configfile=configfile)
+    labels_folder = _data_path.parent / (_data_path.name + "_labels")
+    labels = imread(labels_folder / "TestSet_D07_T0001F002L01A02Z01C01.tif")
+    assert labels.dtype == np.uint16
+    assert np.unique(labels).tolist() == [0, 4]
+
+
+def test_label_writer():
+    """Test that pending label writes are limited, and can be waited for per plate."""
+    release = threading.Event()
+    written = []
+
+    def _write(name):
+        release.wait()
+        written.append(name)
+
+    with _LabelWriter(max_workers=1, max_pending=2) as writer:
+        writer.submit(partial(_write, "a"), logger="plate1")
+        writer.submit(partial(_write, "b"), logger="plate2")
+        blocked = threading.Thread(target=writer.submit, args=(partial(_write, "c"), "plate1"))
+        blocked.start()
+        blocked.join(timeout=0.1)
+        assert blocked.is_alive()
+        release.set()
+        blocked.join()
+        writer.wait("plate1")
+        assert {"a", "c"} <= set(written)
+
+
+def test_run_batch_waits_for_label_writes(tmp_path, monkeypatch):
+    """Test that a plate is finished only once its label images are written."""
+    data_path = shutil.copytree(Path("tests/resources/TestSet"), tmp_path / "plate1" / "TestSet")
+    configfile = tmp_path / "config.yml"
+    configfile.write_text(Path("config.yml").read_text() + "\nsave_labels:\n    compression: zlib\n")
+
+    def _slow_failing_save(*args, **kwargs):
+        time.sleep(0.2)
+        raise OSError("disk full")
+
+    monkeypatch.setattr(main, "_save_label_image", _slow_failing_save)
+    run_batch([data_path], configfiles=configfile, max_workers=1)
+    log = (data_path / "faim_wako_searchfirst.main.log").read_text().rstrip().splitlines()
+    assert "Failed to save labels of TestSet_D07_T0001F002L01A02Z01C01.tif" in log[-2]
+    assert log[-1].endswith("Done processing.")
+
+
+def test_resample(_data_path, tmp_path):
+    """Test re-running only the sample method from saved label images."""
+    config_text = Path("config.yml").read_text() + "\nsave_labels:\n    compression: zlib\n"
+    configfile = tmp_path / "config.yml"
+    configfile.write_text(config_text)
+    run(_data_path, configfile=configfile)
+    csv_path = _data_path / "TestSet_D07_T0001F002L01A02Z01C01.csv"
+    centers_table = pd.read_csv(csv_path, header=None)
+
+    # raw images are not read again
+    raw_path = _data_path / "TestSet_D07_T0001F002L01A02Z01C01.tif"
+    raw_path.write_bytes(b"")
+    dense_configfile = tmp_path / "config_dense.yml"
+    dense_configfile.write_text(config_text.replace("sample: centers", "sample: dense_grid"))
+    assert resample(_data_path, configfile=dense_configfile) == [csv_path]
+    dense_table = pd.read_csv(csv_path, header=None)
+    assert dense_table.values.tolist() == [[0, 75, 75], [1, 125, 75]]
+
+    assert resample(_data_path, configfile=configfile) == [csv_path]
+    assert pd.read_csv(csv_path, header=None).values.tolist() == centers_table.values.tolist()
+
+
+def test_order_filters():
+    """Test that consecutive object-level filters are ordered by cost."""
+    config = confuse.Configuration("faim-wako-searchfirst", read=False)
+    config.set_file("config.yml")
+    assert _order_filters(["intensity", "solidity", "area", "dilate", "feature", "area"], config) == [
+        "area",
+        "solidity",
+        "intensity",
+        "dilate",
+        "area",
+        "feature",
+    ]
+    assert _order_filters(["solidity", "border", "feature", "area"], config) == [
+        "solidity",
+        "border",
+        "area",
+        "feature",
+    ]
+
+    # background-corrected intensity depends on previously removed objects
+    config.set({"intensity": {"background_correction": True}})
+    assert _order_filters(["solidity", "intensity", "area"], config) == ["solidity", "intensity", "area"]
+
+
+def test_estimate(_data_path, tmp_path, monkeypatch):
+    """Test runtime and memory estimate without writing results."""
+    tmp_dir = tmp_path / "tmp"
+    tmp_dir.mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_dir))
+    result = estimate(_data_path, configfile="config.yml", n_samples=5, max_workers=2, seed=0)
+    assert result["n_files"] == 1
+    assert result["n_samples"] == 1
+    assert list(result["stage_seconds"]) == [
+        "read",
+        "segment",
+        "bounding_box",
+        "area",
+        "feature",
+        "solidity",
+        "border",
+        "intensity",
+        "dilate",
+        "sample",
+        "preview",
+    ]
+    assert result["total_seconds"] > 0
+    assert result["peak_memory"] > 0
+    assert result["recommended_workers"] == 1
+    assert "Recommended number of workers: 1" in format_estimate(result)
+    assert result["memory_complete"]
+    assert "torch" not in format_estimate(result)
+    assert "torch" in format_estimate({**result, "memory_complete": False})
+    assert not list(_data_path.glob("*.csv"))
+    assert not (_data_path.parent / (_data_path.name + "_segmentation")).exists()
+    assert not list(tmp_dir.iterdir())
+
+
+def test_estimate_excludes_warm_up(_data_path, monkeypatch):
+    """Test that one-time warm-up of the segment method is not timed."""
+    calls = []
+
+    def _slow_first_call(img, **kwargs):
+        if not calls:
+            time.sleep(0.5)
+        calls.append(img)
+        return threshold(img, **kwargs)
+
+    monkeypatch.setattr(segment, "threshold", _slow_first_call)
+    result = estimate(_data_path, configfile="config.yml", n_samples=1, seed=0)
+    assert len(calls) == 3
+    assert result["stage_seconds"]["segment"] < 0.5
+
+
+def test_run_batch(tmp_path):
+    """Test batch run over several plates with checkpoint and resume."""
+    testset_path = Path("tests/resources/TestSet")
+    plates = [shutil.copytree(testset_path, tmp_path / name / "TestSet") for name in ("plate1", "plate2")]
+    checkpoint = tmp_path / "checkpoint.txt"
+    run_batch(plates, configfiles="config.yml", checkpoint=checkpoint, max_workers=2)
+
+    csv_paths = [plate / "TestSet_D07_T0001F002L01A02Z01C01.csv" for plate in plates]
+    assert all(csv_path.exists() for csv_path in csv_paths)
+    assert all((plate / "faim_wako_searchfirst.main.log").exists() for plate in plates)
+    assert len(checkpoint.read_text().splitlines()) == 2
+
+    # resume: completed fields are not processed again
+    csv_paths[0].unlink()
+    run_batch(plates, configfiles=["config.yml", "config.yml"], checkpoint=checkpoint)
+    assert not csv_paths[0].exists()
+    assert "Resuming" in (plates[0] / "faim_wako_searchfirst.main.log").read_text()
+
+
+def test_run_batch_with_failed_field(tmp_path):
+    """Test that plates with failed fields are still finished."""
+    testset_path = Path("tests/resources/TestSet")
+    plates = [shutil.copytree(testset_path, tmp_path / name / "TestSet") for name in ("plate1", "plate2")]
+    (plates[0] / "TestSet_D07_T0002F001L01A01Z01C01.tif").write_bytes(b"not a tif")
+    run_batch(plates, configfiles="config.yml", max_workers=2)
+
+    log_paths = [(plate / "faim_wako_searchfirst.main.log").resolve() for plate in plates]
+    for plate, log_path in zip(plates, log_paths, strict=True):
+        assert (plate / "TestSet_D07_T0001F002L01A02Z01C01.csv").exists()
+        assert log_path.read_text().rstrip().endswith("Done processing.")
+        assert not logging.getLogger(f"faim_wako_searchfirst.main[{log_path}]").handlers
+    assert "Failed to process TestSet_D07_T0002F001L01A01Z01C01.tif" in log_paths[0].read_text()
+
+
+def test_run_batch_with_failing_plate(tmp_path, monkeypatch):
+    """Test that errors while finishing one plate do not stop the other plates."""
+    testset_path = Path("tests/resources/TestSet")
+    plates = [shutil.copytree(testset_path, tmp_path / name / "TestSet") for name in ("plate1", "plate2", "plate3")]
+    failing_config = tmp_path / "config_plan.yml"
+    failing_config.write_text(
+        Path("config.yml").read_text()
+        + "\nplan:\n    field_positions: missing.csv\n    pixel_size: 2.0\n"
+        + "    mag_first_pass: 4\n    mag_second_pass: 60\n"
+    )
+    run_batch(plates, configfiles=[failing_config, "config.yml", "config.yml"], max_workers=1)
+    for plate in plates:
+        assert (plate / "TestSet_D07_T0001F002L01A02Z01C01.csv").exists()
+        assert (plate / "faim_wako_searchfirst.main.log").read_text().rstrip().endswith("Done processing.")
+    assert "Failed to plan" in (plates[0] / "faim_wako_searchfirst.main.log").read_text()
+
+    # unexpected errors while finishing a plate are logged as well
+    finish_plate = main._finish_plate
+
+    def _failing_finish_plate(process, folder_path, tif_files):
+        finish_plate(process, folder_path, tif_files)
+        if folder_path == plates[0]:
+            raise RuntimeError("finish failed")
+
+    monkeypatch.setattr(main, "_finish_plate", _failing_finish_plate)
+    for plate in plates:
+        (plate / "TestSet_D07_T0001F002L01A02Z01C01.csv").unlink()
+    run_batch(plates, configfiles="config.yml", max_workers=1)
+    assert all((plate / "TestSet_D07_T0001F002L01A02Z01C01.csv").exists() for plate in plates)
+
+
+def test_run_batch_execution_config(tmp_path, monkeypatch):
+    """Test that batches use the execution limits of the plate configs, unless given explicitly."""
+    testset_path = Path("tests/resources/TestSet")
+    plates = [shutil.copytree(testset_path, tmp_path / name / "TestSet") for name in ("plate1", "plate2")]
+    configfiles = []
+    for name, max_workers, memory_limit in (("a", 2, 4096), ("b", 3, 1024)):
+        configfile = tmp_path / f"config_{name}.yml"
+        configfile.write_text(
+            Path("config.yml").read_text()
+            + f"\nexecution:\n    max_workers: {max_workers}\n    memory_limit: {memory_limit}\n"
+        )
+        configfiles.append(configfile)
+    limits = []
+    monkeypatch.setattr(
+        main, "_process_all", lambda *args, **kwargs: limits.append((kwargs["max_in_flight"], kwargs["memory_limit"]))
+    )
+    run_batch(plates, configfiles=configfiles)
+    run_batch(plates, configfiles=configfiles, max_workers=1, memory_limit=512)
+    assert limits == [(3, 1024), (1, 512)]
+
+
+def test_run_with_unreadable_header(_data_path, tmp_path):
+    """Test that a file with unreadable TIFF header fails alone, also with a memory limit."""
+    configfile = tmp_path / "config.yml"
+    configfile.write_text(Path("config.yml").read_text() + "\nexecution:\n    memory_limit: 4096\n")
+    (_data_path / "TestSet_D07_T0002F001L01A01Z01C01.tif").write_bytes(b"not a tif")
+    csv_paths = run(_data_path, configfile=configfile)
+    assert csv_paths == [_data_path / "TestSet_D07_T0001F002L01A02Z01C01.csv"]
+    log = (_data_path / "faim_wako_searchfirst.main.log").read_text()
+    assert "Failed to process TestSet_D07_T0002F001L01A01Z01C01.tif" in log
+
+
+@pytest.mark.parametrize(("max_in_flight", "memory_limit", "expected"), [(2, None, 2), (4, 0.5, 1)])
+def test_process_all_backpressure(_data_path, max_in_flight, memory_limit, expected):
+    """Test that the scheduler limits images in flight by count and estimated memory."""
+    tif_file = _data_path / "TestSet_D07_T0001F002L01A02Z01C01.tif"
+    assert _estimate_memory(tif_file) > 0.5 * 2**20
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def _track(tif_file, logger):
+        with lock:
+            running.append(tif_file)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.pop()
+
+    done = []
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        _process_all(
+            executor,
+            ((partial(_track, logger=logging), tif_file) for _ in range(8)),
+            on_done=lambda tif_file, result: done.append(tif_file),
+            max_in_flight=max_in_flight,
+            memory_limit=memory_limit,
+        )
+    assert len(done) == 8
+    assert max(peak) == expected
+
+
 def test_partial(_image, tmp_path):
     """Test segment, filter and sample functionality separately."""
     # segment
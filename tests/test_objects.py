@@ -0,0 +1,50 @@
+# SPDX-FileCopyrightText: 2025 Friedrich Miescher Institute for Biomedical Research (FMI), Basel (Switzerland)
+#
+# SPDX-License-Identifier: MIT
+
+"""Test faim_wako_searchfirst.objects module."""
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+from skimage.io import imread
+from skimage.measure import regionprops
+
+from faim_wako_searchfirst.filter import area, dilate, solidity
+from faim_wako_searchfirst.objects import ObjectTable
+
+
+@pytest.fixture
+def _label_image():
+    return imread(Path("tests") / "resources" / "simple_labels.tif")
+
+
+def _assert_matches_regionprops(objects: ObjectTable, labels: np.ndarray):
+    regions = regionprops(labels)
+    assert objects.label.tolist() == [r.label for r in regions]
+    assert objects.bbox.tolist() == [list(r.bbox) for r in regions]
+    assert objects.area.tolist() == [r.area for r in regions]
+    assert objects.centroid.ravel().tolist() == pytest.approx([c for r in regions for c in r.centroid])
+
+
+def test_object_table(_label_image):
+    """Test object table measurements and lazy properties."""
+    labels = _label_image.copy()
+    objects = ObjectTable(labels)
+    assert len(objects) == 4
+    _assert_matches_regionprops(objects, labels)
+    assert objects.property("solidity").tolist() == pytest.approx([r.solidity for r in regionprops(labels)])
+    with pytest.raises(AttributeError):
+        objects.property("no_such_feature")
+
+
+def test_object_table_update(_label_image):
+    """Test that filters keep a shared object table in sync with the label image."""
+    labels = _label_image.copy()
+    objects = ObjectTable(labels)
+    area(tif_file=None, labels=labels, min_area=0, max_area=5000, objects=objects)
+    solidity(tif_file=None, labels=labels, min_solidity=0.0, max_solidity=0.95, objects=objects)
+    dilate(tif_file=None, labels=labels, pixel_distance=5.0, objects=objects)
+    assert len(objects) < 4
+    _assert_matches_regionprops(objects, labels)
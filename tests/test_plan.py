@@ -0,0 +1,112 @@
+# SPDX-FileCopyrightText: 2025 Friedrich Miescher Institute for Biomedical Research (FMI), Basel (Switzerland)
+#
+# SPDX-License-Identifier: MIT
+
+"""Test faim_wako_searchfirst.plan module."""
+
+import csv
+import logging
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from faim_wako_searchfirst.main import run
+from faim_wako_searchfirst.plan import merge_duplicates, plate, shortest_path
+
+
+def _path_length(points):
+    return np.sum(np.linalg.norm(np.diff(points, axis=0), axis=1))
+
+
+def test_merge_duplicates():
+    """Test merging of tiles closer than a given distance along both axes."""
+    points = np.array([[0.0, 0.0], [5.0, 1.0], [30.0, 0.0], [34.0, 20.0], [100.0, 100.0]])
+    keep = merge_duplicates(points, distance=np.array([10.0, 10.0]))
+    assert keep.tolist() == [0, 2, 3, 4]
+
+
+def test_merge_duplicates_chain():
+    """Test that tiles chained by overlapping fields are not merged transitively."""
+    field_a = [[x, 0.0] for x in (0.0, 18.0, 36.0, 54.0)]
+    field_b = [[x, 0.0] for x in (9.0, 27.0, 45.0)]
+    keep = merge_duplicates(np.array(field_a + field_b), distance=np.array([10.0, 10.0]))
+    assert keep.tolist() == [0, 1, 2, 3]
+
+
+def test_shortest_path():
+    """Test ordering of tiles along a short path."""
+    rng = np.random.default_rng(0)
+    points = rng.uniform(0, 1000, size=(200, 2))
+    order = shortest_path(points)
+    assert order[0] == 0
+    assert sorted(order.tolist()) == list(range(200))
+    assert _path_length(points[order]) < 0.5 * _path_length(points)
+
+    line = np.array([[0.0, 0.0], [3.0, 0.0], [1.0, 0.0], [2.0, 0.0]])
+    assert shortest_path(line).tolist() == [0, 2, 3, 1]
+
+
+def test_plate(tmp_path):
+    """Test mapping of field coordinates to stage coordinates, with duplicates across overlapping fields."""
+    data_path = shutil.copytree(Path("tests/resources/TestSet"), tmp_path / "TestSet")
+    field_a = data_path / "TestSet_D07_T0001F002L01A02Z01C01.tif"
+    field_b = data_path / "Other_name_D07_T0001F002L01A02Z01C01.tif"
+    with open(field_a.with_suffix(".csv"), "w", newline="") as csv_file:
+        csv.writer(csv_file).writerows([[1, 128, 128], [2, 250, 128]])
+    with open(field_b.with_suffix(".csv"), "w", newline="") as csv_file:
+        csv.writer(csv_file).writerows([[1, 28, 128], [2, 128, 28]])
+    positions = tmp_path / "positions.csv"
+    with open(positions, "w", newline="") as csv_file:
+        csv.writer(csv_file).writerows([[field_a.name, 0.0, 0.0], [field_b.name, 200.0, 0.0]])
+
+    plan_csv = tmp_path / "plan.csv"
+    plate(
+        [field_a, field_b],
+        plan_csv,
+        field_positions=positions,
+        pixel_size=1.0,
+        mag_first_pass=4,
+        mag_second_pass=20,
+    )
+    table = pd.read_csv(plan_csv, header=None)
+    assert len(table) == 3
+    assert table[0].tolist() == [0, 1, 2]
+    assert table[1].tolist() == [field_a.stem, field_a.stem, field_b.stem]
+    assert table[[3, 4]].values.ravel().tolist() == pytest.approx([0.0, 0.0, 122.0, 0.0, 200.0, -100.0])
+
+
+def test_run_with_plan(tmp_path):
+    """Test that run writes a plate-level plan when configured."""
+    data_path = shutil.copytree(Path("tests/resources/TestSet"), tmp_path / "TestSet")
+    with open(tmp_path / "positions.csv", "w", newline="") as csv_file:
+        csv.writer(csv_file).writerow(["TestSet_D07_T0001F002L01A02Z01C01.tif", 1000.0, 2000.0])
+    configfile = tmp_path / "config.yml"
+    configfile.write_text(
+        Path("config.yml").read_text()
+        + "\nplan:\n    field_positions: positions.csv\n    pixel_size: 2.0\n"
+        + "    mag_first_pass: 4\n    mag_second_pass: 60\n"
+    )
+    run(data_path, configfile=configfile)
+    table = pd.read_csv(tmp_path / "TestSet_plan.csv", header=None)
+    assert len(table) == 1
+    assert table.iloc[0, 3:].tolist() == pytest.approx([1000.0 + (87.5 - 128) * 2, 2000.0 + (84.5 - 128) * 2])
+
+
+def test_run_with_failing_plan(tmp_path):
+    """Test that a failing plan is logged, without replacing the result of run."""
+    data_path = shutil.copytree(Path("tests/resources/TestSet"), tmp_path / "TestSet")
+    configfile = tmp_path / "config.yml"
+    configfile.write_text(
+        Path("config.yml").read_text()
+        + "\nplan:\n    field_positions: missing.csv\n    pixel_size: 2.0\n"
+        + "    mag_first_pass: 4\n    mag_second_pass: 60\n"
+    )
+    assert run(data_path, configfile=configfile) == [data_path / "TestSet_D07_T0001F002L01A02Z01C01.csv"]
+    log_path = (data_path / "faim_wako_searchfirst.main.log").resolve()
+    log = log_path.read_text()
+    assert "Failed to plan the second pass: FileNotFoundError" in log
+    assert log.rstrip().endswith("Done processing.")
+    assert not logging.getLogger(f"faim_wako_searchfirst.main[{log_path}]").handlers
@@ -0,0 +1,40 @@
+# SPDX-FileCopyrightText: 2025 Friedrich Miescher Institute for Biomedical Research (FMI), Basel (Switzerland)
+#
+# SPDX-License-Identifier: MIT
+
+"""Test startup time of a threshold-only run."""
+
+import json
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from faim_wako_searchfirst.main import run
+imported = time.perf_counter()
+run(sys.argv[1], configfile="config.yml")
+finished = time.perf_counter()
+print(json.dumps({
+    "import_time": imported - start,
+    "run_time": finished - imported,
+    "heavy_modules": sorted({"torch", "cellpose"} & set(sys.modules)),
+}))
+"""
+
+
+def test_threshold_run_does_not_import_torch(tmp_path):
+    """Measure startup time of a threshold-only run in a fresh interpreter, and check torch is not imported."""
+    data_path = shutil.copytree(Path("tests/resources/TestSet"), tmp_path / "TestSet")
+    result = subprocess.run(
+        [sys.executable, "-c", _SCRIPT, str(data_path)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    timing = json.loads(result.stdout.strip().splitlines()[-1])
+    print(f"import: {timing['import_time']:.2f} s, run: {timing['run_time']:.2f} s")
+    assert timing["heavy_modules"] == []
+    assert (data_path / "TestSet_D07_T0001F002L01A02Z01C01.csv").exists()